@@ -4,7 +4,19 @@ import adsk.core
 import adsk.fusion
 import traceback
 import math
+import os
+from . import feasibility
 from . import fusionUtils
+from . import lobe
+
+# Bump whenever the generated geometry changes so stale library entries are discarded
+GENERATOR_VERSION = 1
+LIBRARY_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'library')
+CLEARANCE_TOLERANCE = 1e-3 # Allowed pin overlap as a fraction of the roller radius
+POSE_SWEEP_STEPS = 64 # The number of eccentric shaft angles the pin clearance is checked at
+MAP_PIN_SPAN = 10 # The feasibility map shows this many pin counts either side of the current one
+MAP_RATIO_STEP = 0.05 # The eccentricity ratio step between rows of the feasibility map
+MAP_RATIO_MAX = 0.7 # The largest eccentricity ratio on the feasibility map
 
 
 def run(context):
@@ -40,9 +52,53 @@ class CreatedObject:
 
     def __init__(self):
         self.parameters = {}
-
-    def build(self, app, ui):
-        """ Perform the features to create the component """
+        self.precomputed = None
+        self.library = fusionUtils.ComponentLibrary(LIBRARY_DIRECTORY, GENERATOR_VERSION)
+
+    def validate(self, parameters):
+        """ Check the parameters can describe a drive before any work is started.
+            Returns a list of problems, which is empty if the parameters are valid """
+        return feasibility.getViolations(parameters)
+
+    def describe(self, parameters):
+        """ Map which numbers of pins and eccentricity ratios can be built around the current design """
+        N = int(parameters['N'])
+        first = max(3, N - MAP_PIN_SPAN)
+        xValues = list(range(first, first + 2 * MAP_PIN_SPAN + 1))
+        yValues = [MAP_RATIO_STEP * i for i in range(1, round(MAP_RATIO_MAX / MAP_RATIO_STEP) + 1)]
+        feasible = feasibility.getFeasibilityMap(parameters, 'N', xValues, 'eccentricityRatio', yValues)
+
+        # mark the closest cell with whether the current design itself can be built
+        current = None
+        ratio = parameters['eccentricityRatio']
+        if N in xValues and yValues[0] <= ratio <= yValues[-1]:
+            row = min(range(len(yValues)), key=lambda j: abs(yValues[j] - ratio))
+            current = (xValues.index(N), row, not feasibility.getViolations(parameters))
+        return feasibility.formatFeasibilityMap(feasible, 'N', xValues, 'eccentricityRatio', yValues, current)
+
+    def precompute(self, parameters):
+        """ Do the work which doesn't need Fusion: sample one lobe of the profile and
+            check the rotor against the pins through a turn of the eccentric shaft.
+            This runs on a worker thread so must not touch Fusion """
+        R = parameters['R']
+        N = int(parameters['N'])
+        (Rr, E, maxDist, minDist) = getConstants(parameters)
+
+        rotorLobe = lobe.LobeProfile.sample(R, Rr, E, N, maxDist, minDist)
+        crankAngles = [2 * math.pi * i / POSE_SWEEP_STEPS for i in range(POSE_SWEEP_STEPS)]
+
+        # check the lobe shrunk by the allowed overlap, so any overlap left is an interference
+        tolerance = CLEARANCE_TOLERANCE * Rr
+        clearance = lobe.getClearance(rotorLobe.offset(-tolerance), R, Rr, E, crankAngles) - tolerance
+
+        errors = []
+        if clearance < -tolerance:
+            errors.append('The rotor interferes with the pins by {:.4f} cm'.format(-clearance))
+        return {'lobe': rotorLobe, 'clearance': clearance, 'errors': errors}
+
+    def build(self, app, ui, isPreview):
+        """ Perform the features to create the component
+            isPreview: True while the dialog is only previewing the design """
 
         newComp = fusionUtils.createNewComponent(app)
         if newComp is None:
@@ -64,80 +120,92 @@ class CreatedObject:
         units_mgr = app.activeProduct.unitsManager
 
         #other constants based on the original inputs
-        housing_cir = 2 * R * math.pi
-        Rr = housing_cir / (4 * N)#roller radius
-        E = eccentricityRatio * Rr#eccentricity
-        maxDist = 0.25 * Rr #maximum allowed distance between points
-        minDist = 0.5 * maxDist #the minimum allowed distance between points
+        (Rr, E, maxDist, minDist) = getConstants(self.parameters)
         
         
         product = app.activeProduct
         design = adsk.fusion.Design.cast(product)
         root = design.rootComponent
 
-        rotorOcc = root.occurrences.addNewComponent(adsk.core.Matrix3D.create())
-        rotor = rotorOcc.component
-        rotor.name = 'rotor'
-
-        sk = rotor.sketches.add(root.xYConstructionPlane)
-
-        points = adsk.core.ObjectCollection.create()
-
-        #ui.messageBox('Ratio will be ' + 1/N)
-
-        (xs, ys) = getPoint(0, R, Rr, E, N)
-        points.add(adsk.core.Point3D.create(xs,ys,0))
+        # Insert the rotor and housing from the library if this drive has been built before
+        # the extra gears are copied in afterwards so they don't change what is stored
+        key = self.library.key({name: value for name, value in self.parameters.items() if name != 'numGears'})
+        occurrences = self.library.insert(app, key, root)
+        if occurrences is not None:
+            rotorOcc = occurrences['rotor']
+            transform = rotorOcc.transform
+            transform.translation = adsk.core.Vector3D.create(E, 0, 0)
+            rotorOcc.transform = transform
+            design.snapshots.add()
+        else:
+            # The profile is normally ready from the background work started by the dialog
+            precomputed = self.precomputed
+            if precomputed is None:
+                precomputed = self.precompute(self.parameters)
+            rotorOcc, housingOcc = self.generate(design, root, precomputed['lobe'], rotorThickness, housingThickness,
+                R, Rr, E, N, bore, numHoles, holePinDiameter, holeCircleDiameter)
+            # previews are thrown away and rebuilt by execute, so only keep real builds
+            if not isPreview:
+                self.library.store(design, key, [('rotor', rotorOcc.component), ('housing', housingOcc.component)])
 
-        et = 2 * math.pi / (N-1)
-        (xe, ye) = getPoint(et, R, Rr, E, N)
-        x = xs
-        y = ys
-        dist = 0
-        ct = 0
-        dt = math.pi / N
-        numPoints = 0
 
-        while ((math.sqrt((x-xe)**2 + (y-ye)**2) > maxDist or ct < et/2) and ct < et): #close enough to the end to call it, but over half way
-        #while (ct < et/80): #close enough to the end to call it, but over half way
-            (xt, yt) = getPoint(ct+dt, R, Rr, E, N)
-            dist = getDist(x, y, xt, yt)
+        # Create multiple gears
 
-            ddt = dt/2
-            lastTooBig = False
-            lastTooSmall = False
+        body = rotorOcc.component.bRepBodies.item(0)
+        
+        # Check to see if the body is in the root component or another one.
+        target = None
+        if body.assemblyContext:
+            # It's in another component.
+            target = body.assemblyContext
+        else:
+            # It's in the root component.
+            target = root
 
-            while (dist > maxDist or dist < minDist):
-                if (dist > maxDist):
-                    if (lastTooSmall):
-                        ddt /= 2
+        # Get the xSize.
+        xSize = body.boundingBox.maxPoint.x - body.boundingBox.minPoint.x            
 
-                    lastTooSmall = False
-                    lastTooBig = True
+        # Create several copies of the body.
+        currentZ = 0
+        for i in range(0,int(numGears)-1):
+            # Create the copy.
+            newBody = body.copyToComponent(target)
+            
+            # Increment the position.            
+            currentZ +=  rotorThickness
 
-                    if (ddt > dt/2):
-                        ddt = dt/2
+            trans = adsk.core.Matrix3D.create()
+            trans.translation = adsk.core.Vector3D.create(0, 0, currentZ)
+            
 
-                    dt -= ddt
+            # Move the body using a move feature.
+            bodyColl = adsk.core.ObjectCollection.create()
+            bodyColl.add(newBody)
+            moveInput = root.features.moveFeatures.createInput(bodyColl, trans)
+            moveFeat = root.features.moveFeatures.add(moveInput)
+            
+            if (i%2 == 0):
+                rotation = adsk.core.Matrix3D.create()
+                rotation.setToRotation(units_mgr.convert(180, "deg", "rad"), root.yConstructionAxis.geometry.getData()[2], adsk.core.Point3D.create(0, 0, currentZ + rotorThickness/2))
+                moveInput2 = root.features.moveFeatures.createInput(bodyColl, rotation)
+                moveFeat = root.features.moveFeatures.add(moveInput2)
 
-                elif (dist < minDist):
-                    if (lastTooBig):
-                        ddt /= 2
 
-                    lastTooSmall = True
-                    lastTooBig = False
-                    dt += ddt
+    def generate(self, design, root, rotorLobe, rotorThickness, housingThickness, R, Rr, E, N,
+                 bore, numHoles, holePinDiameter, holeCircleDiameter):
+        """ Create the rotor and housing components from scratch.
+            Returns the (rotor, housing) occurrences """
 
+        rotorOcc = root.occurrences.addNewComponent(adsk.core.Matrix3D.create())
+        rotor = rotorOcc.component
+        rotor.name = 'rotor'
 
-                (xt, yt) = getPoint(ct+dt, R, Rr, E, N)
-                dist = getDist(x, y, xt, yt)
+        sk = rotor.sketches.add(root.xYConstructionPlane)
 
-            x = xt
-            y = yt
+        points = adsk.core.ObjectCollection.create()
+        for (x, y) in rotorLobe.points():
             points.add(adsk.core.Point3D.create(x,y,0))
-            numPoints += 1
-            ct += dt
 
-        points.add(adsk.core.Point3D.create(xe,ye,0))
         crv = sk.sketchCurves.sketchFittedSplines.add(points)
 
         lines = sk.sketchCurves.sketchLines
@@ -286,63 +354,13 @@ class CreatedObject:
             # Create the circular pattern
             circularFeat = circularFeats.add(circularFeatInput)
 
-
-        # Create multiple gears
-
-        body = body1
-        
-        # Check to see if the body is in the root component or another one.
-        target = None
-        if body.assemblyContext:
-            # It's in another component.
-            target = body.assemblyContext
-        else:
-            # It's in the root component.
-            target = root
-
-        # Get the xSize.
-        xSize = body.boundingBox.maxPoint.x - body.boundingBox.minPoint.x            
-
-        # Create several copies of the body.
-        currentZ = 0
-        for i in range(0,int(numGears)-1):
-            # Create the copy.
-            newBody = body.copyToComponent(target)
-            
-            # Increment the position.            
-            currentZ +=  rotorThickness
-
-            trans = adsk.core.Matrix3D.create()
-            trans.translation = adsk.core.Vector3D.create(0, 0, currentZ)
-            
-
-            # Move the body using a move feature.
-            bodyColl = adsk.core.ObjectCollection.create()
-            bodyColl.add(newBody)
-            moveInput = root.features.moveFeatures.createInput(bodyColl, trans)
-            moveFeat = root.features.moveFeatures.add(moveInput)
-            
-            if (i%2 == 0):
-                rotation = adsk.core.Matrix3D.create()
-                rotation.setToRotation(units_mgr.convert(180, "deg", "rad"), root.yConstructionAxis.geometry.getData()[2], adsk.core.Point3D.create(0, 0, currentZ + rotorThickness/2))
-                moveInput2 = root.features.moveFeatures.createInput(bodyColl, rotation)
-                moveFeat = root.features.moveFeatures.add(moveInput2)
-
-
-def getPoint(t, R, Rr, E, N):
-    """ Get a point on a cycloid with the given parameters
-
-        t: parameter
-        R: major radius
-        Rr: rolling radius
-        E: eccentricity
-        N: number of pins """
-    psi = math.atan2(math.sin((1-N)*t), ((R/(E*N))-math.cos((1-N)*t)))
-    x = (R*math.cos(t))-(Rr*math.cos(t+psi))-(E*math.cos(N*t))
-    y = (-R*math.sin(t))+(Rr*math.sin(t+psi))+(E*math.sin(N*t))
-    return (x,y)
+        return rotorOcc, housingOcc
 
 
-def getDist(xa, ya, xb, yb):
-    """ Get distance between two 2D points (xa,ya) and (xb,yb)"""
-    return math.sqrt((xa-xb)**2 + (ya-yb)**2)
+def getConstants(parameters):
+    """ Get the constants which follow from the parameters:
+        (roller radius, eccentricity, maximum and minimum distance between profile points) """
+    (Rr, E) = feasibility.getGeometry(parameters['R'], parameters['N'], parameters['eccentricityRatio'])
+    maxDist = 0.25 * Rr #maximum allowed distance between points
+    minDist = 0.5 * maxDist #the minimum allowed distance between points
+    return (Rr, E, maxDist, minDist)
@@ -0,0 +1,125 @@
+""" Closed form checks of the drive geometry.
+    Every constraint is evaluated directly from the parameters without
+    sampling the profile, so whole grids of designs can be checked
+    before Fusion is asked to build anything """
+
+import math
+
+
+def getGeometry(R, N, eccentricityRatio):
+    """ Get the (roller radius, eccentricity) for a drive """
+    Rr = (2 * R * math.pi) / (4 * N) #roller radius
+    E = eccentricityRatio * Rr #eccentricity
+    return (Rr, E)
+
+
+def getMinimumCurvatureRadius(R, E, N):
+    """ Get the smallest radius of curvature on the convex parts of the path
+        traced by the roller centres relative to the rotor. The rotor profile
+        cusps wherever the roller radius is larger than this.
+
+        Both the speed and the curvature of the path only depend on
+        c = cos((N-1)t), so the minimum is at one of the ends of c or at the
+        single stationary point between them.
+
+        R: major radius
+        E: eccentricity
+        N: number of pins """
+    def speedSquared(c):
+        return R*R + E*E*N*N - 2*R*E*N*c
+
+    def turning(c):
+        return R*R + E*E*N**3 - R*E*N*(N+1)*c
+
+    stationary = ((2-N)*R*R + E*E*N*N*(2*N-1)) / (R*E*N*(N+1))
+    radii = [speedSquared(c)**1.5 / turning(c) for c in (-1.0, 1.0, stationary)
+             if -1.0 <= c <= 1.0 and turning(c) > 0]
+    return min(radii) if radii else float('inf')
+
+
+def getViolations(parameters):
+    """ Check every geometric constraint on the parameters.
+        Returns a list of problems, which is empty if the drive can be built """
+    errors = []
+    for name in ('rotorThickness', 'housingThickness', 'R', 'bore', 'eccentricityRatio'):
+        if parameters[name] <= 0:
+            errors.append('{} must be greater than zero'.format(name))
+    if parameters['numHoles'] > 0:
+        for name in ('holePinDiameter', 'holeCircleDiameter'):
+            if parameters[name] <= 0:
+                errors.append('{} must be greater than zero when there are drive holes'.format(name))
+    for name, minimum in (('N', 3), ('numGears', 1), ('numHoles', 0)):
+        if parameters[name] != int(parameters[name]) or parameters[name] < minimum:
+            errors.append('{} must be a whole number of at least {}'.format(name, minimum))
+    if errors:
+        return errors
+
+    R = parameters['R']
+    N = parameters['N']
+    bore = parameters['bore']
+    numHoles = parameters['numHoles']
+    (Rr, E) = getGeometry(R, N, parameters['eccentricityRatio'])
+
+    if E * N >= R:
+        errors.append('Eccentricity is too large for the number of pins, the profile loops')
+    elif getMinimumCurvatureRadius(R, E, N) <= Rr:
+        errors.append('Eccentricity is too large for the number of pins, the profile is undercut')
+
+    # the smallest radius of the rotor, between two lobes
+    rootRadius = R - E - Rr
+    if bore / 2 >= rootRadius:
+        errors.append('The bore is larger than the rotor')
+
+    if numHoles > 0:
+        # the holes are widened by the eccentricity so the pins can orbit in them
+        holePinDiameter = parameters['holePinDiameter']
+        holeRadius = holePinDiameter / 2 + E
+        holeCircleRadius = parameters['holeCircleDiameter'] / 2
+
+        if holePinDiameter + 2 * E >= rootRadius - bore / 2:
+            errors.append('The drive holes are wider than the web between the bore and the rotor edge')
+        else:
+            if holeCircleRadius - holeRadius <= bore / 2:
+                errors.append('The drive holes overlap the bore')
+            if holeCircleRadius + holeRadius >= rootRadius:
+                errors.append('The drive holes break through the rotor edge')
+        if numHoles > 1 and holeCircleRadius * math.sin(math.pi / numHoles) <= holeRadius:
+            errors.append('The drive holes overlap each other')
+
+    return errors
+
+
+def getFeasibilityMap(parameters, xName, xValues, yName, yValues):
+    """ Check a grid of designs which vary two of the parameters.
+        Returns one row per y value, each a list of booleans which are
+        True where the design is buildable
+
+        parameters: the values used for everything not being varied
+        xName, yName: the names of the parameters being varied
+        xValues, yValues: the values to try for each """
+    feasible = []
+    for y in yValues:
+        row = []
+        for x in xValues:
+            trial = dict(parameters)
+            trial[xName] = x
+            trial[yName] = y
+            row.append(not getViolations(trial))
+        feasible.append(row)
+    return feasible
+
+
+def formatFeasibilityMap(feasible, xName, xValues, yName, yValues, current=None):
+    """ Draw a feasibility map as text, '#' for buildable designs and '.' for the rest.
+        current: optional (x index, y index, buildable) of the design being edited,
+        drawn as 'O' or 'X' depending on whether that design itself is buildable """
+    lines = ['{} (down) vs {} (across {:g} to {:g})'.format(yName, xName, xValues[0], xValues[-1])]
+    for j in reversed(range(len(yValues))):
+        cells = ''
+        for i, ok in enumerate(feasible[j]):
+            if current is not None and current[:2] == (i, j):
+                cells += 'O' if current[2] else 'X'
+            else:
+                cells += '#' if ok else '.'
+        lines.append('{:>6.3g} {}'.format(yValues[j], cells))
+    return '\n'.join(lines)
@@ -6,31 +6,110 @@ import adsk.core
 import adsk.fusion
 import traceback
 import math
+import threading
+from .library import ComponentLibrary
+
+STATUS_INPUT_ID = 'status' # The text box which reports invalid inputs
+DESCRIPTION_INPUT_ID = 'description' # The text box which shows the object's description of the inputs
 
 
 class CommandExecuteHandler(adsk.core.CommandEventHandler):
     """ Executes the reading of parameters and the building of the object """
-    def __init__(self, app, ui, object_class, input_parameters):
+    def __init__(self, app, ui, object_class, input_parameters, computation, is_preview):
         super().__init__()
         self.object_class = object_class
         self.app = app
         self.parameters = input_parameters
         self.ui = ui
+        self.computation = computation
+        self.is_preview = is_preview
 
     def notify(self, args):
         """ Builds the object from the given inputs """
         try:
-            units_mgr = self.app.activeProduct.unitsManager
             command = args.firingEvent.sender
             inputs = command.commandInputs
 
-            for current_input in inputs:
-                test_parameter = self.parameters.parameter_dict[current_input.id]
-                self.object_class.parameters[current_input.id] =\
-                     units_mgr.evaluateExpression(current_input.expression, test_parameter.units)
+            parameters = readParameters(self.app, self.parameters, inputs)
+            if parameters is None:
+                return
+            self.object_class.parameters = parameters
+
+            # Only the Fusion features are left to do once the background work has finished
+            result = self.computation.result(parameters)
+            if result['errors']:
+                self.ui.messageBox('\n'.join(result['errors']), 'Invalid Inputs')
+                return
+            self.object_class.precomputed = result
+
+            self.object_class.build(self.app, self.ui, self.is_preview)
+
+            # a valid preview is committed in place of execute, so leave it
+            # uncommitted to let execute rebuild and store the result
+            if not self.is_preview:
+                args.isValidResult = True
+
+        except:
+            if self.ui:
+                self.ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+
+
+class CommandInputChangedHandler(adsk.core.InputChangedEventHandler):
+    """ Starts the background work for the new inputs as soon as they change """
+    def __init__(self, app, ui, object_class, input_parameters, computation):
+        super().__init__()
+        self.object_class = object_class
+        self.app = app
+        self.parameters = input_parameters
+        self.ui = ui
+        self.computation = computation
 
-            self.object_class.build(self.app, self.ui)
-            args.isValidResult = True
+    def notify(self, args):
+        try:
+            parameters = readParameters(self.app, self.parameters, args.inputs)
+            if parameters is not None and not self.object_class.validate(parameters):
+                self.computation.start(parameters)
+
+        except:
+            if self.ui:
+                self.ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+
+
+class CommandValidateInputsHandler(adsk.core.ValidateInputsEventHandler):
+    """ Checks the inputs and any finished background results, reporting problems in the dialog """
+    def __init__(self, app, ui, object_class, input_parameters, computation):
+        super().__init__()
+        self.object_class = object_class
+        self.app = app
+        self.parameters = input_parameters
+        self.ui = ui
+        self.computation = computation
+
+    def notify(self, args):
+        try:
+            inputs = args.inputs
+            parameters = readParameters(self.app, self.parameters, inputs)
+            if parameters is None:
+                errors = ['An expression is invalid']
+            else:
+                errors = self.object_class.validate(parameters)
+
+            # never wait for the worker here, its checks are reported once it has
+            # finished and execute and preview refuse to build if they fail
+            result = None
+            if not errors:
+                result = self.computation.peek(parameters)
+                if result is not None:
+                    errors = result['errors']
+
+            status = inputs.itemById(STATUS_INPUT_ID)
+            if errors:
+                status.text = '\n'.join(errors)
+            else:
+                status.text = 'OK' if result is not None else 'Checking...'
+            if parameters is not None:
+                inputs.itemById(DESCRIPTION_INPUT_ID).text = self.object_class.describe(parameters)
+            args.areInputsValid = not errors
 
         except:
             if self.ui:
@@ -69,15 +148,22 @@ class CommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
         try:
             cmd = args.command
             cmd.isRepeatable = False
-            onExecute = CommandExecuteHandler(self.app, self.ui,  self.object_class, self.parameters)
+            computation = BackgroundComputation(self.object_class.precompute)
+            onExecute = CommandExecuteHandler(self.app, self.ui,  self.object_class, self.parameters, computation, False)
             cmd.execute.add(onExecute)
-            onExecutePreview = CommandExecuteHandler(self.app, self.ui, self.object_class, self.parameters)
+            onExecutePreview = CommandExecuteHandler(self.app, self.ui, self.object_class, self.parameters, computation, True)
             cmd.executePreview.add(onExecutePreview)
+            onInputChanged = CommandInputChangedHandler(self.app, self.ui, self.object_class, self.parameters, computation)
+            cmd.inputChanged.add(onInputChanged)
+            onValidateInputs = CommandValidateInputsHandler(self.app, self.ui, self.object_class, self.parameters, computation)
+            cmd.validateInputs.add(onValidateInputs)
             onDestroy = CommandDestroyHandler(self.ui)
             cmd.destroy.add(onDestroy)
             # keep the handler referenced beyond this function
             self.handlers.append(onExecute)
             self.handlers.append(onExecutePreview)
+            self.handlers.append(onInputChanged)
+            self.handlers.append(onValidateInputs)
             self.handlers.append(onDestroy)
 
             #define the inputs
@@ -85,6 +171,11 @@ class CommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
             for parameter in self.parameters.parameter_list:
                 init_value = adsk.core.ValueInput.createByReal(parameter.default_value)
                 inputs.addValueInput(parameter.id, parameter.description, parameter.units, init_value)
+            inputs.addTextBoxCommandInput(STATUS_INPUT_ID, 'Status', '', 3, True)
+            inputs.addTextBoxCommandInput(DESCRIPTION_INPUT_ID, 'Feasibility', '', 16, True)
+
+            # start on the default design while the user reads the dialog
+            computation.start(self.parameters.defaultValues())
 
         except:
             if self.ui:
@@ -121,6 +212,68 @@ class Parameters:
         self.parameter_list.append(new_param)
         self.parameter_dict[name] = new_param
 
+    def defaultValues(self):
+        """ Get a dictionary of the default value of every parameter """
+        return {parameter.id: parameter.default_value for parameter in self.parameter_list}
+
+
+class BackgroundComputation:
+    """ Runs a function of the parameters on a worker thread.
+        Only the result for the most recent parameters is kept; work
+        started for older parameters is discarded when it finishes """
+
+    def __init__(self, function):
+        self.function = function
+        self.parameters = None
+        self.thread = None
+        self.outcome = None
+
+    def start(self, parameters):
+        """ Begin computing for parameters unless that is already under way """
+        if parameters == self.parameters:
+            return
+
+        outcome = {}
+        def work():
+            try:
+                outcome['result'] = self.function(parameters)
+            except Exception as error:
+                outcome['error'] = error
+
+        self.parameters = dict(parameters)
+        self.outcome = outcome
+        self.thread = threading.Thread(target=work, daemon=True)
+        self.thread.start()
+
+    def peek(self, parameters):
+        """ Get the result for parameters if it has already finished, otherwise None """
+        if parameters != self.parameters or self.thread.is_alive():
+            return None
+        return self.result(parameters)
+
+    def result(self, parameters):
+        """ Get the result for parameters, waiting for or starting the work as needed """
+        self.start(parameters)
+        self.thread.join()
+        if 'error' in self.outcome:
+            raise self.outcome['error']
+        return self.outcome['result']
+
+
+def readParameters(app, parameters, inputs):
+    """ Read the value inputs into a dictionary of parameter values.
+        Returns None if any expression cannot be evaluated """
+    units_mgr = app.activeProduct.unitsManager
+    values = {}
+    for current_input in inputs:
+        if current_input.id not in parameters.parameter_dict:
+            continue
+        if not current_input.isValidExpression:
+            return None
+        test_parameter = parameters.parameter_dict[current_input.id]
+        values[current_input.id] = units_mgr.evaluateExpression(current_input.expression, test_parameter.units)
+    return values
+
 
 def createNewComponent(app):
     """ Create a new component in the active design """
@@ -0,0 +1,169 @@
+""" A local library of generated components so that designs which have
+    already been built can be inserted instead of regenerated.
+    Components are exported as Fusion archives and indexed by a hash of
+    the parameters they were generated from """
+
+import adsk.core
+import adsk.fusion
+import hashlib
+import json
+import os
+import time
+
+
+class ComponentLibrary:
+    """ Stores exported components on disk keyed by their design parameters """
+
+    def __init__(self, directory, version, max_entries=20, max_bytes=200 * 1024 * 1024):
+        """ directory: the folder the archives and index are stored in
+            version: the generator version, entries from any other version are discarded
+            max_entries: the maximum number of parameter sets kept
+            max_bytes: the maximum total size of the stored archives """
+        self.directory = directory
+        self.version = str(version)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, 'index.json')
+        self.entries = None # read from disk the first time the library is used
+        self.unavailable = False
+
+    def ready(self):
+        """ Load the index on first use. Returns False if the library can't be
+            used, e.g. because the directory is read-only """
+        if self.entries is None and not self.unavailable:
+            try:
+                self.load()
+            except OSError:
+                self.entries = None
+                self.unavailable = True
+        return not self.unavailable
+
+    def key(self, parameters):
+        """ Get the library key for a dictionary of parameters """
+        items = ['{}={:.9g}'.format(name, parameters[name]) for name in sorted(parameters)]
+        text = self.version + ';' + ';'.join(items)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def load(self):
+        """ Read the index, dropping it entirely if it was written by another version """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        index = {}
+        if os.path.isfile(self.index_path):
+            try:
+                with open(self.index_path, 'r') as index_file:
+                    index = json.load(index_file)
+            except ValueError:
+                index = {}
+
+        if index.get('version') == self.version:
+            self.entries = index.get('entries', {})
+        else:
+            self.invalidate()
+
+    def save(self):
+        """ Write the index to disk """
+        with open(self.index_path, 'w') as index_file:
+            json.dump({'version': self.version, 'entries': self.entries}, index_file, indent=1)
+
+    def invalidate(self):
+        """ Remove every stored archive, e.g. after the generator has changed """
+        for name in os.listdir(self.directory):
+            if name.endswith('.f3d'):
+                os.remove(os.path.join(self.directory, name))
+        self.entries = {}
+        self.save()
+
+    def contains(self, key):
+        """ Check whether every archive for the key is still on disk """
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        return all(os.path.isfile(self.path(key, name)) for name in entry['names'])
+
+    def path(self, key, name):
+        """ Get the archive path for one component of an entry """
+        return os.path.join(self.directory, '{}_{}.f3d'.format(key, name))
+
+    def insert(self, app, key, target):
+        """ Import the stored components for key into the target component.
+            Returns a dictionary of the new occurrences by name, or None if the key is not stored """
+        if not self.ready() or not self.contains(key):
+            return None
+
+        import_mgr = app.importManager
+        occurrences = {}
+        for name in self.entries[key]['names']:
+            count = target.occurrences.count
+            options = import_mgr.createFusionArchiveImportOptions(self.path(key, name))
+            if not import_mgr.importToTarget(options, target):
+                # don't leave part of the entry behind in the design
+                for occurrence in occurrences.values():
+                    occurrence.deleteMe()
+                self.remove(key)
+                try:
+                    self.save()
+                except OSError:
+                    pass
+                return None
+            occurrences[name] = target.occurrences.item(count)
+
+        self.entries[key]['used'] = time.time()
+        try:
+            self.save()
+        except OSError:
+            pass # only the eviction order is lost
+        return occurrences
+
+    def store(self, design, key, components):
+        """ Export the given components under key and evict old entries if needed
+            components: a list of (name, component) pairs
+            Returns False if the components couldn't be stored """
+        if not self.ready():
+            return False
+
+        export_mgr = design.exportManager
+        names = [name for name, _ in components]
+        try:
+            size = 0
+            for name, component in components:
+                path = self.path(key, name)
+                options = export_mgr.createFusionArchiveExportOptions(path, component)
+                if not export_mgr.execute(options):
+                    raise OSError('Failed to export ' + path)
+                size += os.path.getsize(path)
+
+            self.entries[key] = {'names': names, 'size': size, 'used': time.time()}
+            self.evict()
+            self.save()
+        except OSError:
+            # don't keep a partial entry, the design is still built without the library
+            self.entries.pop(key, None)
+            self.deleteArchives(key, names)
+            return False
+        return True
+
+    def evict(self):
+        """ Remove the least recently used entries until the library is within its limits """
+        by_age = sorted(self.entries, key=lambda key: self.entries[key]['used'])
+        total = sum(entry['size'] for entry in self.entries.values())
+        while by_age and (len(self.entries) > self.max_entries or total > self.max_bytes):
+            key = by_age.pop(0)
+            total -= self.entries[key]['size']
+            self.remove(key)
+
+    def remove(self, key):
+        """ Forget an entry and delete its archives """
+        entry = self.entries.pop(key)
+        self.deleteArchives(key, entry['names'])
+
+    def deleteArchives(self, key, names):
+        """ Delete whichever archives of an entry are on disk, ignoring any that can't be removed """
+        for name in names:
+            path = self.path(key, name)
+            try:
+                if os.path.isfile(path):
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,208 @@
+""" A compact representation of the rotor profile.
+    The profile repeats N-1 times around the rotor, so only one lobe is
+    sampled and anything needing the whole rotor rotates that lobe
+    instead of evaluating the curve again """
+
+import array
+import math
+
+
+class LobeProfile:
+    """ One sampled lobe of the rotor profile, centred on the origin.
+        Holds the points, the unit tangents and the curvature (positive
+        where the profile bulges outwards) in flat arrays """
+
+    def __init__(self, N, xs, ys, txs, tys, curvatures):
+        self.N = N
+        self.xs = array.array('d', xs)
+        self.ys = array.array('d', ys)
+        self.txs = array.array('d', txs)
+        self.tys = array.array('d', tys)
+        self.curvatures = array.array('d', curvatures)
+
+        # the rotation of each lobe, shared by every whole-rotor operation
+        lobeAngle = 2 * math.pi / (N - 1)
+        self.rotations = [(math.cos(k * lobeAngle), math.sin(k * lobeAngle)) for k in range(N - 1)]
+
+    @classmethod
+    def sample(cls, R, Rr, E, N, maxDist, minDist):
+        """ Sample one lobe with its points spaced between minDist and maxDist apart
+
+            R: major radius
+            Rr: rolling radius
+            E: eccentricity
+            N: number of pins """
+        N = int(N)
+        xs, ys, txs, tys, curvatures = [], [], [], [], []
+        (ts, points) = sampleLobe(R, Rr, E, N, maxDist, minDist)
+        for (t, (x, y)) in zip(ts, points):
+            xs.append(x)
+            ys.append(y)
+
+            # the profile is the path of the roller centres moved in by Rr,
+            # so it shares that path's tangent and its radius of curvature is Rr smaller
+            dx = -R*math.sin(t) + E*N*math.sin(N*t)
+            dy = -R*math.cos(t) + E*N*math.cos(N*t)
+            speed = math.sqrt(dx*dx + dy*dy)
+            txs.append(dx / speed)
+            tys.append(dy / speed)
+            pathCurvature = (R*R + E*E*N**3 - R*E*N*(N+1)*math.cos((N-1)*t)) / speed**3
+            curvatures.append(pathCurvature / (1 - Rr*pathCurvature))
+        return cls(N, xs, ys, txs, tys, curvatures)
+
+    def __len__(self):
+        return len(self.xs)
+
+    def points(self):
+        """ Get the lobe as a list of (x, y) points """
+        return list(zip(self.xs, self.ys))
+
+    def offset(self, distance):
+        """ Get the lobe moved outwards along its normals by distance (inwards if negative) """
+        xs = [x - distance*ty for (x, ty) in zip(self.xs, self.tys)]
+        ys = [y + distance*tx for (y, tx) in zip(self.ys, self.txs)]
+        curvatures = [k / (1 + distance*k) for k in self.curvatures]
+        return LobeProfile(self.N, xs, ys, self.txs, self.tys, curvatures)
+
+    def place(self, c, s, dx=0.0, dy=0.0):
+        """ Get the lobe as (xs, ys) lists, turned by the rotation with cosine c
+            and sine s about the rotor centre and then moved by (dx, dy) """
+        xs = [x*c - y*s + dx for (x, y) in zip(self.xs, self.ys)]
+        ys = [x*s + y*c + dy for (x, y) in zip(self.xs, self.ys)]
+        return (xs, ys)
+
+    def outline(self, angle=0.0, dx=0.0, dy=0.0):
+        """ Get the whole rotor outline as (xs, ys) arrays, one lobe after another.
+            The rotor is turned by angle about its centre and then moved by (dx, dy) """
+        (ca, sa) = (math.cos(angle), math.sin(angle))
+        xs = array.array('d')
+        ys = array.array('d')
+        for (ck, sk) in self.rotations:
+            (lobeXs, lobeYs) = self.place(ca*ck - sa*sk, sa*ck + ca*sk, dx, dy)
+            xs.extend(lobeXs)
+            ys.extend(lobeYs)
+        return (xs, ys)
+
+    def pose(self, crankAngle, E):
+        """ Get the rotor outline when the eccentric shaft has turned by crankAngle.
+            The rotor turns backwards by 1/(N-1) of the crank angle """
+        return self.outline(-crankAngle / (self.N - 1), E*math.cos(crankAngle), E*math.sin(crankAngle))
+
+    def lobePose(self, crankAngle, E):
+        """ Get just this lobe, as (xs, ys) lists, where it sits when the eccentric
+            shaft has turned by crankAngle """
+        angle = -crankAngle / (self.N - 1)
+        return self.place(math.cos(angle), math.sin(angle), E*math.cos(crankAngle), E*math.sin(crankAngle))
+
+    def lobeSweep(self, crankAngles, E):
+        """ Get just this lobe at each of the crank angles.
+
+            Turning the whole drive by 2*pi*k/N maps the pins onto themselves
+            and lobe k at crank angle a onto this lobe at a - 2*pi*k/N, so
+            sweeping this one lobe through a full turn meets every lobe against
+            the pins and whole outlines aren't needed """
+        for crankAngle in crankAngles:
+            yield self.lobePose(crankAngle, E)
+
+
+def getClearance(lobe, R, Rr, E, crankAngles):
+    """ Get the smallest gap between the rotor and the pins over a sweep of crank angles.
+        Negative values mean the rotor and pins overlap
+
+        lobe: the LobeProfile of the rotor
+        R: major radius
+        Rr: rolling radius
+        E: eccentricity
+        crankAngles: the eccentric shaft angles to check, covering a full turn
+        so that every lobe is checked """
+    N = lobe.N
+    pinAngle = 2 * math.pi / N
+    pins = [(R * math.cos(pin * pinAngle), R * math.sin(pin * pinAngle)) for pin in range(N)]
+
+    clearance = float('inf')
+    for (xs, ys) in lobe.lobeSweep(crankAngles, E):
+        for (x, y) in zip(xs, ys):
+            # only the closest pins can be the nearest
+            nearest = round(math.atan2(y, x) / pinAngle)
+            for pin in (nearest - 1, nearest, nearest + 1):
+                (px, py) = pins[pin % N]
+                clearance = min(clearance, getDist(x, y, px, py) - Rr)
+    return clearance
+
+
+def sampleLobe(R, Rr, E, N, maxDist, minDist):
+    """ Choose parameters along one lobe of the rotor profile so the points
+        are spaced between minDist and maxDist apart.
+        Returns the list of t and the list of (x, y) points at them """
+    (xs, ys) = getPoint(0, R, Rr, E, N)
+    ts = [0]
+    points = [(xs, ys)]
+
+    et = 2 * math.pi / (N-1)
+    (xe, ye) = getPoint(et, R, Rr, E, N)
+    x = xs
+    y = ys
+    ct = 0
+    dt = math.pi / N
+
+    while ((math.sqrt((x-xe)**2 + (y-ye)**2) > maxDist or ct < et/2) and ct < et): #close enough to the end to call it, but over half way
+        (xt, yt) = getPoint(ct+dt, R, Rr, E, N)
+        dist = getDist(x, y, xt, yt)
+
+        ddt = dt/2
+        lastTooBig = False
+        lastTooSmall = False
+
+        while (dist > maxDist or dist < minDist):
+            if (dist > maxDist):
+                if (lastTooSmall):
+                    ddt /= 2
+
+                lastTooSmall = False
+                lastTooBig = True
+
+                if (ddt > dt/2):
+                    ddt = dt/2
+
+                dt -= ddt
+
+            elif (dist < minDist):
+                if (lastTooBig):
+                    ddt /= 2
+
+                lastTooSmall = True
+                lastTooBig = False
+                dt += ddt
+
+
+            (xt, yt) = getPoint(ct+dt, R, Rr, E, N)
+            dist = getDist(x, y, xt, yt)
+
+        x = xt
+        y = yt
+        ct += dt
+        ts.append(ct)
+        points.append((x, y))
+
+    ts.append(et)
+    points.append((xe, ye))
+    return (ts, points)
+
+
+def getPoint(t, R, Rr, E, N):
+    """ Get a point on a cycloid with the given parameters
+
+        t: parameter
+        R: major radius
+        Rr: rolling radius
+        E: eccentricity
+        N: number of pins """
+    psi = math.atan2(math.sin((1-N)*t), ((R/(E*N))-math.cos((1-N)*t)))
+    x = (R*math.cos(t))-(Rr*math.cos(t+psi))-(E*math.cos(N*t))
+    y = (-R*math.sin(t))+(Rr*math.sin(t+psi))+(E*math.sin(N*t))
+    return (x,y)
+
+
+def getDist(xa, ya, xb, yb):
+    """ Get distance between two 2D points (xa,ya) and (xb,yb)"""
+    return math.sqrt((xa-xb)**2 + (ya-yb)**2)